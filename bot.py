@@ -1,93 +1,106 @@
 import sqlite3
-import pandas as pd
+import xlsxwriter
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from config import TOKEN
 import logging
 import asyncio
+import itertools
 from datetime import datetime
 import os
-import time
+import signal
+from database import vacancies_db, users_db
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
+# Колонки Excel-отчета: поле в БД и заголовок
+REPORT_COLUMNS = [
+    ("title", "Должность"),
+    ("company", "Компания"),
+    ("region", "Регион"),
+    ("salary", "Зарплата"),
+    ("experience", "Опыт работы"),
+    ("work_format", "Формат работы"),
+    ("published_at", "Дата публикации"),
+    ("link", "Ссылка"),
+]
+REPORT_LIMIT = 1000  # Максимум вакансий в отчете
+
+# Режим webhook: если задан WEBHOOK_URL (например, https://example.com), Telegram
+# сам присылает обновления и бот не опрашивает getUpdates
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+
+
+def _register_user_sync(conn, user):
+    """Регистрация пользователя в БД. Возвращает True, если пользователь новый"""
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user.id,))
+    if cursor.fetchone():
+        return False
+
+    cursor.execute(
+        "INSERT INTO users (user_id, username, first_name, last_name) VALUES (?, ?, ?, ?)",
+        (user.id, user.username, user.first_name, user.last_name)
+    )
+    conn.commit()
+    return True
 
-def get_db_connection(db_name="vacancies.db"):
-    """Безопасное подключение к SQLite с таймаутом"""
-    conn = None
-    attempts = 0
-    while attempts < 3:
-        try:
-            conn = sqlite3.connect(db_name, timeout=10)
-            conn.execute("PRAGMA busy_timeout = 10000")
-            return conn
-        except sqlite3.OperationalError as e:
-            logger.warning(f"Ошибка подключения к {db_name} (попытка {attempts + 1}): {e}")
-            time.sleep(1)
-            attempts += 1
-    raise sqlite3.OperationalError(f"Не удалось подключиться к {db_name} после 3 попыток")
+
+def _unregister_user_sync(conn, user_id):
+    """Удаление пользователя из БД. Возвращает True, если пользователь был подписан"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM users WHERE user_id = ? RETURNING user_id", (user_id,))
+    deleted = cursor.fetchone() is not None
+    conn.commit()
+    return deleted
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start - регистрация пользователя"""
     user = update.effective_user
     try:
-        conn = get_db_connection("users.db")
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user.id,))
-        if not cursor.fetchone():
-            cursor.execute(
-                "INSERT INTO users (user_id, username, first_name, last_name) VALUES (?, ?, ?, ?)",
-                (user.id, user.username, user.first_name, user.last_name)
-            )
-            conn.commit()
-            await update.message.reply_text(
-                "✅ Вы успешно зарегистрированы!\n"
-                "Теперь вы будете получать уведомления о новых вакансиях.\n"
-                "Используйте /report для получения отчета по вакансиям."
-            )
-            logger.info(f"Новый пользователь: {user.id} {user.username}")
-        else:
-            await update.message.reply_text("Вы уже зарегистрированы!")
+        # Блокирующая работа с SQLite выполняется в отдельном потоке,
+        # чтобы ожидание блокировки БД не останавливало цикл событий
+        is_new = await users_db.write(_register_user_sync, user)
 
     except Exception as e:
         logger.error(f"Ошибка регистрации пользователя: {e}")
         await update.message.reply_text("⚠ Произошла ошибка при регистрации")
-    finally:
-        if conn:
-            conn.close()
+        return
+
+    if is_new:
+        await update.message.reply_text(
+            "✅ Вы успешно зарегистрированы!\n"
+            "Теперь вы будете получать уведомления о новых вакансиях.\n"
+            "Используйте /report для получения отчета по вакансиям."
+        )
+        logger.info(f"Новый пользователь: {user.id} {user.username}")
+    else:
+        await update.message.reply_text("Вы уже зарегистрированы!")
 
 
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /stop - отписка от уведомлений"""
     user = update.effective_user
     try:
-        conn = get_db_connection("users.db")
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM users WHERE user_id = ?", (user.id,))
-        conn.commit()
-
-        if cursor.rowcount > 0:
-            await update.message.reply_text(
-                "Вы больше не будете получать уведомления.\n"
-                "Чтобы снова подписаться, отправьте /start"
-            )
-            logger.info(f"Пользователь отписался: {user.id}")
-        else:
-            await update.message.reply_text("Вы не были подписаны на уведомления.")
+        deleted = await users_db.write(_unregister_user_sync, user.id)
 
     except Exception as e:
         logger.error(f"Ошибка отписки пользователя: {e}")
         await update.message.reply_text("⚠ Произошла ошибка при отписке")
-    finally:
-        if conn:
-            conn.close()
+        return
+
+    if deleted:
+        await update.message.reply_text(
+            "Вы больше не будете получать уведомления.\n"
+            "Чтобы снова подписаться, отправьте /start"
+        )
+        logger.info(f"Пользователь отписался: {user.id}")
+    else:
+        await update.message.reply_text("Вы не были подписаны на уведомления.")
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -102,68 +115,59 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
 
 
+def _write_excel_report(conn):
+    """Запись Excel-отчета из БД (блокирующая, выполняется в отдельном потоке)"""
+    cursor = conn.cursor()
+
+    columns = ", ".join(column for column, _ in REPORT_COLUMNS)
+    cursor.execute(f"SELECT {columns} FROM vacancies ORDER BY published_at DESC LIMIT {REPORT_LIMIT}")
+
+    first_row = cursor.fetchone()
+    if first_row is None:
+        return False, "В базе нет данных о вакансиях"
+
+    # Создаем отчет с текущей датой в названии
+    report_date = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    excel_filename = f"vacancies_report_{report_date}.xlsx"
+
+    # constant_memory: строки сбрасываются на диск по мере записи
+    workbook = xlsxwriter.Workbook(excel_filename, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Вакансии')
+
+    # Настраиваем стили
+    header_format = workbook.add_format({
+        'bold': True,
+        'align': 'center',
+        'valign': 'vcenter',
+        'border': 1,
+        'fg_color': '#D7E4BC'
+    })
+
+    # Форматируем заголовки
+    titles = [column_title for _, column_title in REPORT_COLUMNS]
+    worksheet.write_row(0, 0, titles, header_format)
+
+    # Пишем строки прямо из курсора, попутно считая ширину колонок
+    max_lengths = [len(title) for title in titles]
+    for row_num, row in enumerate(itertools.chain([first_row], cursor), start=1):
+        worksheet.write_row(row_num, 0, row)
+        for col_num, value in enumerate(row):
+            if value is not None:
+                max_lengths[col_num] = max(max_lengths[col_num], len(str(value)))
+
+    # Авто-ширина колонок
+    for col_num, max_len in enumerate(max_lengths):
+        worksheet.set_column(col_num, col_num, max_len + 2)
+
+    workbook.close()
+
+    return True, excel_filename
+
+
 async def generate_excel_report():
     """Генерация Excel-отчета с данными о вакансиях"""
     try:
-        conn = get_db_connection()
-
-        # Получаем данные из базы (без комментариев в SQL)
-        query = """
-            SELECT 
-                title AS 'Должность',
-                company AS 'Компания',
-                region AS 'Регион',
-                salary AS 'Зарплата',
-                experience AS 'Опыт работы',
-                work_format AS 'Формат работы',
-                published_at AS 'Дата публикации',
-                link AS 'Ссылка'
-            FROM vacancies
-            ORDER BY published_at DESC
-            LIMIT 1000
-        """
-
-        df = pd.read_sql_query(query, conn)
-
-        if df.empty:
-            return False, "В базе нет данных о вакансиях"
-
-        # Создаем отчет с текущей датой в названии
-        report_date = datetime.now().strftime("%Y-%m-%d_%H-%M")
-        excel_filename = f"vacancies_report_{report_date}.xlsx"
-
-        # Сохраняем в Excel с форматированием
-        writer = pd.ExcelWriter(excel_filename, engine='xlsxwriter')
-        df.to_excel(writer, index=False, sheet_name='Вакансии')
-
-        # Форматирование
-        workbook = writer.book
-        worksheet = writer.sheets['Вакансии']
-
-        # Настраиваем стили
-        header_format = workbook.add_format({
-            'bold': True,
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1,
-            'fg_color': '#D7E4BC'
-        })
-
-        # Авто-ширина колонок
-        for col_num, column_title in enumerate(df.columns):
-            max_len = max(
-                df[column_title].astype(str).map(len).max(),
-                len(column_title)
-            ) + 2
-            worksheet.set_column(col_num, col_num, max_len)
-
-        # Форматируем заголовки
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
-        writer.close()
-
-        return True, excel_filename
+        return await vacancies_db.read(_write_excel_report)
 
     except sqlite3.Error as e:
         logger.error(f"Ошибка SQL при генерации отчета: {e}")
@@ -171,9 +175,6 @@ async def generate_excel_report():
     except Exception as e:
         logger.error(f"Ошибка при генерации отчета: {e}")
         return False, f"Ошибка при генерации отчета: {e}"
-    finally:
-        if conn:
-            conn.close()
 
 
 async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -204,8 +205,8 @@ async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text(result)
 
 
-def main():
-    """Запуск бота"""
+def build_application():
+    """Создание приложения бота с обработчиками команд"""
     application = Application.builder().token(TOKEN).build()
 
     # Регистрируем обработчики команд
@@ -214,9 +215,67 @@ def main():
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("report", report_command))
 
-    application.run_polling()
-    logger.info("Бот запущен и готов к работе")
+    return application
+
+
+async def bot_app():
+    """Работа бота в текущем цикле событий - отдельно или вместе с парсером (main.py)"""
+    application = build_application()
+
+    async with application:
+        await application.start()
+        try:
+            if WEBHOOK_URL:
+                await application.updater.start_webhook(
+                    listen=WEBHOOK_LISTEN,
+                    port=WEBHOOK_PORT,
+                    url_path=TOKEN,
+                    webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{TOKEN}"
+                )
+            else:
+                await application.updater.start_polling()
+            logger.info("Бот запущен и готов к работе")
+            await asyncio.Event().wait()  # Работаем до отмены задачи
+        finally:
+            # Останавливаем все, что успело запуститься, чтобы бот можно было перезапустить
+            if application.updater.running:
+                await application.updater.stop()
+            await application.stop()
+
+
+async def run_standalone():
+    """Работа бота отдельным процессом до сигнала завершения.
+
+    SIGTERM (systemd, docker stop) останавливает бота так же, как Ctrl+C:
+    задача отменяется, и bot_app успевает остановить updater и приложение.
+    """
+    task = asyncio.create_task(bot_app())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGABRT):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except NotImplementedError:
+            pass  # Windows: остается остановка по Ctrl+C через KeyboardInterrupt
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info("Получен сигнал завершения, бот остановлен")
+
+
+def main():
+    """Запуск бота"""
+    try:
+        asyncio.run(run_standalone())
+    finally:
+        vacancies_db.close()
+        users_db.close()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    # Настройка логирования (при запуске из main.py логирование настраивает парсер)
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    main()
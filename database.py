@@ -0,0 +1,132 @@
+import sqlite3
+import logging
+import time
+import asyncio
+
+
+def get_db_connection(db_name="vacancies.db", check_same_thread=True):
+    """Безопасное подключение к SQLite с таймаутами"""
+    conn = None
+    attempts = 0
+    while attempts < 3:
+        try:
+            # Соединения живут долго, поэтому кэш подготовленных запросов
+            # переиспользуется между циклами парсера и командами бота
+            conn = sqlite3.connect(
+                db_name,
+                timeout=20,
+                cached_statements=256,
+                check_same_thread=check_same_thread
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Безопасно в режиме WAL, меньше fsync
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-20000")  # ~20 МБ кэша страниц
+            conn.execute("PRAGMA mmap_size=268435456")  # Чтение через mmap, до 256 МБ
+            conn.execute("PRAGMA busy_timeout=30000")
+            return conn
+        except sqlite3.Error as e:
+            logging.warning(f"Ошибка подключения к {db_name} (попытка {attempts + 1}): {e}")
+            time.sleep(2 ** attempts)  # Экспоненциальная задержка
+            attempts += 1
+    raise sqlite3.OperationalError(f"Не удалось подключиться к {db_name} после 3 попыток")
+
+
+def _mark_retrieved(future):
+    """Ошибку потока после отмены ожидающей задачи уже никто не прочитает"""
+    if not future.cancelled():
+        future.exception()
+
+
+class DBPool:
+    """Долгоживущие соединения с одной базой: один писатель и несколько читателей.
+
+    SQLite допускает только одного писателя, поэтому запись идет через одно
+    соединение под asyncio.Lock. Читатели в режиме WAL не мешают записи.
+    Соединения открываются при первом обращении и живут до close(), сохраняя
+    кэш страниц между циклами парсера и командами бота.
+    """
+
+    def __init__(self, db_name, readers=2):
+        self.db_name = db_name
+        self._readers_count = readers
+        self._writer = None
+        self._writer_lock = asyncio.Lock()
+        self._readers = None
+        self._opened = []
+
+    def _connect(self):
+        # Соединение используется из рабочих потоков: одновременный доступ исключают
+        # блокировка писателя и очередь читателей, которые освобождаются только
+        # после завершения потока
+        conn = get_db_connection(self.db_name, check_same_thread=False)
+        self._opened.append(conn)
+        return conn
+
+    def _write_sync(self, func, args):
+        """Выполнение записи в рабочем потоке, откат - в том же потоке"""
+        if self._writer is None:
+            self._writer = self._connect()
+        try:
+            return func(self._writer, *args)
+        except BaseException:
+            # Незафиксированные изменения не должны попасть в чужую транзакцию
+            self._writer.rollback()
+            raise
+
+    async def write(self, func, *args):
+        """Выполнение func(conn, *args) в отдельном потоке на соединении для записи.
+
+        Отмена ожидающей задачи не останавливает поток, поэтому блокировка
+        снимается только после того, как поток закончил работу с соединением.
+        """
+        await self._writer_lock.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(None, self._write_sync, func, args)
+        except BaseException:
+            self._writer_lock.release()
+            raise
+        future.add_done_callback(_mark_retrieved)
+        future.add_done_callback(lambda _: self._writer_lock.release())
+        return await asyncio.shield(future)
+
+    async def read(self, func, *args):
+        """Выполнение func(conn, *args) в отдельном потоке на соединении для чтения.
+
+        Соединение возвращается в пул только после завершения потока.
+        """
+        if self._readers is None:
+            self._readers = asyncio.Queue()
+            for _ in range(self._readers_count):
+                self._readers.put_nowait(None)  # Слот под соединение, откроется при первом запросе
+
+        slot = [await self._readers.get()]
+
+        def run():
+            if slot[0] is None:
+                slot[0] = self._connect()
+            return func(slot[0], *args)
+
+        try:
+            future = asyncio.get_running_loop().run_in_executor(None, run)
+        except BaseException:
+            self._readers.put_nowait(slot[0])
+            raise
+        future.add_done_callback(_mark_retrieved)
+        future.add_done_callback(lambda _: self._readers.put_nowait(slot[0]))
+        return await asyncio.shield(future)
+
+    def close(self):
+        """Закрытие всех открытых соединений"""
+        for conn in self._opened:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logging.warning(f"Ошибка закрытия соединения с {self.db_name}: {e}")
+        self._opened.clear()
+        self._writer = None
+        self._readers = None
+
+
+vacancies_db = DBPool("vacancies.db")
+users_db = DBPool("users.db")
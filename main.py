@@ -1,15 +1,44 @@
 import sqlite3
-import schedule
-import time
 import logging
 from datetime import datetime, timedelta
-import requests
+import asyncio
+import aiohttp
 import signal
+from bot import bot_app
+from database import vacancies_db, users_db
+
+try:
+    import orjson as json  # Быстрый разбор JSON, если библиотека установлена
+except ImportError:
+    import json
 
 # Настройки
 SEARCH_HOURS = 240  # Ищем вакансии за последние N часов
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 CHECK_INTERVAL = 1  # Проверка каждые N минут
+HH_API_URL = "https://api.hh.ru/vacancies"
+MAX_CONCURRENT_REQUESTS = 3  # Одновременных запросов к API HH.ru
+IDS_CHUNK_SIZE = 500  # Ограничение числа параметров в одном SQL-запросе
+PIPELINE_QUEUE_SIZE = 200  # Вакансий в очереди между загрузкой и сохранением
+SAVE_BATCH_SIZE = 50  # Вакансий в одной пачке записи в БД
+RESTART_DELAY = 30  # Пауза перед перезапуском упавшего парсера или бота, сек
+
+# Формат работы по графику вакансии HH.ru (остальные графики - офис)
+WORK_FORMATS = {
+    "remote": "Удаленная",
+    "flexible": "Гибкий график"
+}
+
+# Символы валют для вывода зарплаты
+CURRENCY_SYMBOLS = {
+    "RUR": "₽",
+    "USD": "$",
+    "EUR": "€"
+}
+
+# ETag последнего записанного ответа HH.ru по каждому региону вместе с date_from
+# запроса: при неизменной выдаче сервер отвечает 304 и разбирать ответ не нужно
+region_etags = {}  # region_id -> (date_from, etag)
 
 # Основные регионы
 REGIONS = {
@@ -20,6 +49,40 @@ REGIONS = {
     113: "Россия"  # Удаленная работа
 }
 
+# Запросы сохранения вакансий: временная таблица пачки и вставка через нее.
+# Списки столбцов должны совпадать во всех трех запросах
+_CREATE_INCOMING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS incoming_vacancies (
+        link TEXT PRIMARY KEY,
+        id INTEGER,
+        title TEXT,
+        company TEXT,
+        salary TEXT,
+        experience TEXT,
+        work_format TEXT,
+        region TEXT,
+        published_at TIMESTAMP
+    )
+"""
+_INSERT_INCOMING_SQL = """
+    INSERT OR IGNORE INTO incoming_vacancies
+    (id, title, link, company, salary, experience,
+     work_format, region, published_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# OR IGNORE остается на случай совпадения id при другой ссылке
+_INSERT_VACANCY_SQL = """
+    INSERT OR IGNORE INTO vacancies
+    (id, title, link, company, salary, experience,
+     work_format, region, published_at)
+    SELECT i.id, i.title, i.link, i.company, i.salary, i.experience,
+           i.work_format, i.region, i.published_at
+    FROM incoming_vacancies i
+    LEFT JOIN vacancies v ON v.link = i.link
+    WHERE v.link IS NULL
+    RETURNING link
+"""
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -40,12 +103,14 @@ def init_db():
         # Удаляем старую таблицу, если существует
         cursor.execute("DROP TABLE IF EXISTS vacancies")
 
-        # Создаем новую таблицу с правильной структурой
+        # Создаем новую таблицу с правильной структурой.
+        # Ключ - ссылка, WITHOUT ROWID: строки хранятся прямо в B-дереве по link,
+        # проверка дубликата при вставке - один спуск по дереву
         cursor.execute("""
             CREATE TABLE vacancies (
-                id INTEGER PRIMARY KEY,
+                link TEXT PRIMARY KEY,
+                id INTEGER UNIQUE NOT NULL,
                 title TEXT NOT NULL,
-                link TEXT UNIQUE NOT NULL,
                 company TEXT,
                 salary TEXT,
                 experience TEXT,
@@ -54,11 +119,10 @@ def init_db():
                 published_at TIMESTAMP,
                 processed BOOLEAN DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
+            ) WITHOUT ROWID
         """)
 
         # Создаем индексы
-        cursor.execute("CREATE INDEX idx_link ON vacancies(link)")
         cursor.execute("CREATE INDEX idx_processed ON vacancies(processed)")
         cursor.execute("CREATE INDEX idx_created ON vacancies(created_at)")
 
@@ -73,80 +137,155 @@ def init_db():
             conn.close()
 
 
-def get_db_connection(db_name="vacancies.db"):
-    """Безопасное подключение к SQLite с таймаутами"""
-    conn = None
-    attempts = 0
-    while attempts < 3:
-        try:
-            conn = sqlite3.connect(db_name, timeout=20)
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA busy_timeout=30000")
-            return conn
-        except sqlite3.OperationalError as e:
-            logging.warning(f"Ошибка подключения (попытка {attempts + 1}): {e}")
-            time.sleep(2 ** attempts)  # Экспоненциальная задержка
-            attempts += 1
-    raise sqlite3.OperationalError(f"Не удалось подключиться к {db_name} после 3 попыток")
-
-
-def fetch_hh_vacancies():
-    """Получение вакансий с API HH.ru с обработкой ошибок"""
-    url = "https://api.hh.ru/vacancies"
-    headers = {"User-Agent": USER_AGENT}
-    all_vacancies = []
-
-    for region_id, region_name in REGIONS.items():
-        params = {
-            "text": "Python",
-            "area": region_id,
-            "per_page": 50,
-            "date_from": (datetime.now() - timedelta(hours=SEARCH_HOURS)).strftime('%Y-%m-%dT%H:%M:%S'),
-            "order_by": "publication_time"
-        }
+async def fetch_region_vacancies(session, semaphore, region_id, region_name, date_from):
+    """Получение вакансий одного региона с API HH.ru.
 
-        try:
-            response = requests.get(url, headers=headers, params=params, timeout=15)
-            response.raise_for_status()
-            items = response.json().get("items", [])
+    Возвращает (вакансии, отметка ETag); вакансии - None, если выдача не изменилась.
+    Отметку (region_id, date_from, etag) запоминают только после записи вакансий.
+    """
+    params = {
+        "text": "Python",
+        "area": region_id,
+        "per_page": 50,
+        "date_from": date_from,
+        "order_by": "publication_time"
+    }
 
+    headers = {}
+    cached = region_etags.get(region_id)
+    if cached and cached[0] == date_from:  # ETag относится только к тому же запросу
+        headers["If-None-Match"] = cached[1]
+
+    try:
+        async with semaphore:  # Не превышаем лимит одновременных запросов к HH.ru
+            async with session.get(HH_API_URL, params=params, headers=headers) as response:
+                if response.status == 304:
+                    logging.info(f"Регион {region_name}: новых данных нет")
+                    return None, None
+                response.raise_for_status()
+                data = json.loads(await response.read())
+                etag = response.headers.get("ETag")
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logging.error(f"Ошибка для региона {region_name}: {str(e)}")
+        return [], None
+
+    items = data.get("items", [])
+    fetched_at = datetime.now().isoformat()  # Один ответ - одно время получения
+    for item in items:
+        item['region'] = region_name
+        item['fetched_at'] = fetched_at
+
+    return items, (region_id, date_from, etag) if etag else None
+
+
+def create_http_session():
+    """HTTP-сессия для HH.ru: пул соединений с keep-alive и кэшем DNS"""
+    return aiohttp.ClientSession(
+        headers={"User-Agent": USER_AGENT},
+        connector=aiohttp.TCPConnector(limit=len(REGIONS), ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(total=15)
+    )
+
+
+async def fetch_hh_vacancies(session, queue):
+    """Параллельное получение вакансий по всем регионам с API HH.ru.
+
+    Вакансии кладутся в queue по мере прихода ответов, за ними - отметка ETag
+    региона, в конце - None. Возвращает число регионов без изменений.
+    """
+    # Начало окна округляется до часа: запрос, а с ним и ETag, остается
+    # тем же между проверками и меняется раз в час
+    hour_start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    date_from = (hour_start - timedelta(hours=SEARCH_HOURS)).strftime('%Y-%m-%dT%H:%M:%S')
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    unchanged = 0
+
+    tasks = [
+        asyncio.create_task(fetch_region_vacancies(session, semaphore, region_id, region_name, date_from))
+        for region_id, region_name in REGIONS.items()
+    ]
+    try:
+        for region in asyncio.as_completed(tasks):
+            items, etag_mark = await region
+            if items is None:
+                unchanged += 1
+                continue
             for item in items:
-                item['region'] = region_name
-                item['fetched_at'] = datetime.now().isoformat()
+                await queue.put(item)
+            if etag_mark:
+                await queue.put(etag_mark)
+    except asyncio.CancelledError:
+        raise  # Обработка уже остановлена: сигнал окончания читать некому
+    except Exception:
+        await queue.put(None)  # Обработка еще идет: даем ей дочитать очередь
+        raise
+    else:
+        await queue.put(None)  # Сигнал окончания выдачи
+    finally:
+        # Запросы оставшихся регионов не должны пережить загрузку
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return unchanged
 
-            all_vacancies.extend(items)
-            time.sleep(0.7)  # Вежливая задержка между запросами
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Ошибка для региона {region_name}: {str(e)}")
-            continue
+async def process_vacancies(queue):
+    """Разбор и пакетное сохранение вакансий по мере их поступления в очередь.
 
-    return all_vacancies
+    Возвращает (получено, обработано, новых).
+    """
+    received = valid = new_count = 0
+    batch = []
+    pending_etags = []
+
+    while True:
+        item = await queue.get()
+        if isinstance(item, tuple):
+            # Отметка идет за всеми вакансиями региона: ETag запоминается
+            # после записи всех полученных до нее вакансий
+            pending_etags.append(item)
+        elif item is not None:
+            received += 1
+            vacancy = parse_vacancy(item)
+            if vacancy is not None:
+                batch.append(vacancy)
+
+        # Сохраняем пачку, пока остальные регионы еще загружаются
+        if batch and (len(batch) >= SAVE_BATCH_SIZE or item is None):
+            valid += len(batch)
+            new_count += await save_vacancies(batch)
+            batch = []
+
+        if not batch:
+            # Все полученные вакансии записаны: при сбое записи ETag не сохраняется
+            # и регион будет загружен заново на следующей проверке
+            for region_id, date_from, etag in pending_etags:
+                region_etags[region_id] = (date_from, etag)
+            pending_etags.clear()
+
+        if item is None:
+            return received, valid, new_count
 
 
 def parse_vacancy(item):
     """Парсинг данных одной вакансии"""
     try:
-        published_at = datetime.strptime(
-            item.get("published_at"),
-            "%Y-%m-%dT%H:%M:%S%z"
-        ).strftime('%Y-%m-%d %H:%M:%S')
+        # HH.ru отдает даты в фиксированном формате 2024-05-01T12:30:00+0300:
+        # дата и время вырезаются срезами, без разбора в datetime
+        raw_published_at = item.get("published_at")
+        published_at = raw_published_at[:10] + " " + raw_published_at[11:19]
 
         schedule_data = item.get("schedule", {})
-        work_format = "Не указан"
         if schedule_data:
-            schedule_id = schedule_data.get("id")
-            if schedule_id == "remote":
-                work_format = "Удаленная"
-            elif schedule_id == "flexible":
-                work_format = "Гибкий график"
-            else:
-                work_format = "Офис"
+            work_format = WORK_FORMATS.get(schedule_data.get("id"), "Офис")
+        else:
+            work_format = "Не указан"
 
         return {
             "id": item.get("id"),
             "title": item.get("name", "").strip(),
-            "link": item.get("alternate_url", "").split('?')[0],  # Убираем параметры ссылки
+            "link": item.get("alternate_url", "").partition('?')[0],  # Убираем параметры ссылки
             "company": (item.get("employer", {}).get("name") or "").strip(),
             "salary": format_salary(item.get("salary")),
             "experience": (item.get("experience", {}).get("name") or "Не указан").strip(),
@@ -165,96 +304,122 @@ def format_salary(salary_data):
     if not salary_data:
         return "Не указана"
 
-    currency_map = {
-        "RUR": "₽",
-        "USD": "$",
-        "EUR": "€"
-    }
-
     from_val = salary_data.get("from")
     to_val = salary_data.get("to")
-    currency = currency_map.get(salary_data.get("currency", "RUR"), "₽")
+    currency = CURRENCY_SYMBOLS.get(salary_data.get("currency", "RUR"), "₽")
 
     if from_val and to_val:
-        return f"{from_val:,.0f}–{to_val:,.0f} {currency}".replace(',', ' ')
+        return f"{_format_amount(from_val)}–{_format_amount(to_val)} {currency}"
     elif from_val:
-        return f"от {from_val:,.0f} {currency}".replace(',', ' ')
+        return f"от {_format_amount(from_val)} {currency}"
     elif to_val:
-        return f"до {to_val:,.0f} {currency}".replace(',', ' ')
+        return f"до {_format_amount(to_val)} {currency}"
     return "Не указана"
 
 
-def save_vacancies(vacancies):
-    """Пакетное сохранение вакансий в БД"""
-    if not vacancies:
-        return 0
+def _format_amount(value):
+    """Сумма с пробелами между разрядами: 150000 -> '150 000'"""
+    return f"{value:_.0f}".replace('_', ' ')
 
-    new_count = 0
-    conn = None
 
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+def _insert_vacancies_sync(conn, vacancies):
+    """Вставка новых вакансий (блокирующая, выполняется в отдельном потоке).
 
-        for vacancy in vacancies:
-            if not vacancy:
-                continue
+    Возвращает ссылки на реально добавленные вакансии.
+    """
+    cursor = conn.cursor()
 
-            try:
-                cursor.execute(
-                    """INSERT OR IGNORE INTO vacancies 
-                    (id, title, link, company, salary, experience, 
-                     work_format, region, published_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        vacancy["id"],
-                        vacancy["title"],
-                        vacancy["link"],
-                        vacancy["company"],
-                        vacancy["salary"],
-                        vacancy["experience"],
-                        vacancy["work_format"],
-                        vacancy["region"],
-                        vacancy["published_at"]
-                    )
-                )
-                if cursor.rowcount > 0:
-                    new_count += 1
-
-            except Exception as e:
-                logging.error(f"Ошибка сохранения вакансии {vacancy.get('id')}: {e}")
+    # Большая часть выдачи уже есть в БД с прошлых проверок: отсекаем ее
+    # чтением по индексу id еще до транзакции записи
+    ids = [vacancy["id"] for vacancy in vacancies]
+    existing = set()
+    for i in range(0, len(ids), IDS_CHUNK_SIZE):
+        chunk = ids[i:i + IDS_CHUNK_SIZE]
+        cursor.execute(
+            f"SELECT id FROM vacancies WHERE id IN ({','.join('?' * len(chunk))})",
+            chunk
+        )
+        existing.update(str(row[0]) for row in cursor.fetchall())
 
-        conn.commit()
+    vacancies = [vacancy for vacancy in vacancies if str(vacancy["id"]) not in existing]
+    if not vacancies:
+        return []
+
+    # Блокировку записи берем сразу: отложенная транзакция может не суметь
+    # повыситься до записи, если параллельно пишет другой процесс
+    cursor.execute("BEGIN IMMEDIATE")
+
+    # Пачка загружается во временную таблицу, а отбор новых и вставка
+    # выполняются одним запросом на стороне SQLite
+    cursor.execute(_CREATE_INCOMING_SQL)
+    cursor.executemany(
+        _INSERT_INCOMING_SQL,
+        [
+            (
+                vacancy["id"],
+                vacancy["title"],
+                vacancy["link"],
+                vacancy["company"],
+                vacancy["salary"],
+                vacancy["experience"],
+                vacancy["work_format"],
+                vacancy["region"],
+                vacancy["published_at"]
+            )
+            for vacancy in vacancies
+        ]
+    )
+    cursor.execute(_INSERT_VACANCY_SQL)
+    new_links = [row[0] for row in cursor.fetchall()]
+    cursor.execute("DELETE FROM incoming_vacancies")
+
+    conn.commit()
+    return new_links
+
+
+async def save_vacancies(vacancies):
+    """Пакетное сохранение вакансий в БД"""
+    # Одна вакансия может прийти из нескольких регионов (город и "Россия")
+    vacancies = list({v["id"]: v for v in vacancies if v}.values())
+    if not vacancies:
+        return 0
+
+    try:
+        # Запись в SQLite не должна блокировать цикл событий, общий с ботом
+        new_links = await vacancies_db.write(_insert_vacancies_sync, vacancies)
 
     except Exception as e:
         logging.error(f"Ошибка работы с БД: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
-    return new_count
+    return len(new_links)
 
 
-def run_parser_job():
+async def run_parser_job(session):
     """Основная задача парсера"""
     try:
         logging.info("Начало проверки вакансий...")
 
-        # Получаем сырые данные
-        raw_vacancies = fetch_hh_vacancies()
-        if not raw_vacancies:
-            logging.info("Нет данных от API HH.ru")
+        # Получение, разбор и сохранение идут одновременно: очередь передает
+        # вакансии от загрузки к сохранению и ограничивает число ожидающих
+        queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        producer = asyncio.create_task(fetch_hh_vacancies(session, queue))
+        try:
+            received, valid, new_count = await process_vacancies(queue)
+        except BaseException:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)  # Дожидаемся остановки загрузки
+            raise
+        unchanged = await producer  # Пробрасываем ошибки загрузки, если они были
+
+        if not received:
+            if unchanged:
+                logging.info(f"Выдача HH.ru не изменилась (регионов: {unchanged}), новых вакансий нет")
+            else:
+                logging.info("Нет данных от API HH.ru")
             return
 
-        # Парсим и фильтруем
-        parsed_vacancies = [parse_vacancy(item) for item in raw_vacancies]
-        valid_vacancies = [v for v in parsed_vacancies if v is not None]
-
-        # Сохраняем в БД
-        new_count = save_vacancies(valid_vacancies)
-
-        logging.info(f"Обработано вакансий: {len(valid_vacancies)}, новых: {new_count}")
+        logging.info(f"Обработано вакансий: {valid}, новых: {new_count}")
 
     except Exception as e:
         logging.error(f"Критическая ошибка в парсере: {e}")
@@ -267,6 +432,48 @@ def graceful_shutdown(signum, frame):
     exit(0)
 
 
+async def scheduler():
+    """Периодический запуск парсера: между проверками процесс спит в asyncio.sleep"""
+    loop = asyncio.get_running_loop()
+    interval = CHECK_INTERVAL * 60
+
+    # Одна сессия на все время работы: соединения и DNS переиспользуются между проверками
+    async with create_http_session() as session:
+        next_run = loop.time()
+        while True:
+            try:
+                await run_parser_job(session)
+            except Exception:
+                # Ошибка уже записана в лог: сбой одной проверки не останавливает парсер
+                logging.warning("Проверка прервана, следующая - по расписанию")
+            # Постоянный шаг по монотонным часам, без сдвига на длительность проверки.
+            # После затянувшейся проверки следующая начинается сразу, без "догоняющих" запусков
+            next_run = max(next_run + interval, loop.time())
+            await asyncio.sleep(next_run - loop.time())
+
+
+async def supervise(name, run):
+    """Запуск части процесса с перезапуском после сбоя.
+
+    Парсер и бот перезапускаются отдельно, падение одного не затрагивает другого.
+    """
+    while True:
+        try:
+            await run()
+            logging.warning(f"{name} остановился, перезапуск через {RESTART_DELAY} с")
+        except Exception as e:
+            logging.error(f"{name} упал: {e}, перезапуск через {RESTART_DELAY} с")
+        await asyncio.sleep(RESTART_DELAY)
+
+
+async def run_all():
+    """Совместный запуск парсера и бота"""
+    await asyncio.gather(
+        supervise("Telegram-бот", bot_app),
+        supervise("Парсер", scheduler)
+    )
+
+
 def main():
     """Основная функция"""
     # Настройка обработчиков сигналов
@@ -276,23 +483,20 @@ def main():
     # Инициализация БД
     init_db()
 
-    # Первый запуск сразу
-    run_parser_job()
-
-    # Настройка периодического выполнения
-    schedule.every(CHECK_INTERVAL).minutes.do(run_parser_job)
-
     logging.info(f"Парсер запущен, проверка каждые {CHECK_INTERVAL} мин.")
 
-    # Основной цикл
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    # Парсер (первый запуск сразу, далее каждые CHECK_INTERVAL минут)
+    # и Telegram-бот работают в одном процессе и одном цикле событий
+    try:
+        asyncio.run(run_all())
+    finally:
+        vacancies_db.close()
+        users_db.close()
 
 
 if __name__ == "__main__":
     print("=" * 50)
-    print("🚀 Парсер вакансий HH.ru")
+    print("🚀 Парсер вакансий HH.ru и Telegram-бот")
     print(f"🔍 Проверка каждые {CHECK_INTERVAL} минут")
     print(f"⏳ Поиск за последние {SEARCH_HOURS // 24} дней")
     print("=" * 50)
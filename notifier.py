@@ -1,8 +1,15 @@
 import sqlite3
 import logging
-import time
+import asyncio
+import aiohttp
 from config import TOKEN
-import requests
+from database import get_db_connection
+
+TELEGRAM_RATE_LIMIT = 25  # Сообщений в секунду (лимит Telegram - 30)
+PER_CHAT_DELAY = 1  # Пауза между сообщениями в один чат, сек
+CHECK_INTERVAL = 300  # Проверка каждые 5 минут
+
+_INSERT_SENT_SQL = "INSERT OR IGNORE INTO sent_notifications (vacancy_id, user_id) VALUES (?, ?)"
 
 # Настройка логирования
 logging.basicConfig(
@@ -15,22 +22,6 @@ logging.basicConfig(
 )
 
 
-def get_db_connection(db_name):
-    """Безопасное подключение к SQLite с повторными попытками"""
-    attempts = 0
-    while attempts < 3:
-        try:
-            conn = sqlite3.connect(db_name, timeout=20)
-            conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA busy_timeout=30000")
-            return conn
-        except sqlite3.Error as e:
-            logging.warning(f"Ошибка подключения к {db_name} (попытка {attempts + 1}): {e}")
-            time.sleep(2 ** attempts)  # Экспоненциальная задержка
-            attempts += 1
-    raise sqlite3.OperationalError(f"Не удалось подключиться к {db_name} после 3 попыток")
-
-
 def init_databases():
     """Инициализация всех необходимых таблиц в базах данных"""
     try:
@@ -66,7 +57,28 @@ def init_databases():
         raise
 
 
-def send_telegram_message(chat_id, text):
+class BotBlockedError(Exception):
+    """Пользователь заблокировал бота или удалил аккаунт"""
+
+
+class RateLimiter:
+    """Равномерное ограничение частоты запросов: не более rate запросов в секунду"""
+
+    def __init__(self, rate):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def send_telegram_message(session, chat_id, text):
     """Отправка сообщения через Telegram Bot API"""
     url = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
     payload = {
@@ -77,10 +89,12 @@ def send_telegram_message(chat_id, text):
     }
 
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        return True
-    except requests.exceptions.RequestException as e:
+        async with session.post(url, json=payload) as response:
+            if response.status == 403:
+                raise BotBlockedError(f"Бот заблокирован пользователем {chat_id}")
+            response.raise_for_status()
+            return True
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         logging.error(f"Ошибка отправки сообщения: {e}")
         return False
 
@@ -100,108 +114,153 @@ def format_vacancy_message(vacancy):
     )
 
 
-def get_new_vacancies(limit=50):
-    """Получение новых вакансий из базы с фильтром по удаленной работе"""
+def get_new_vacancies(conn, user_id, limit=50):
+    """Получение вакансий, еще не отправленных пользователю, с фильтром по удаленной работе"""
     try:
-        with get_db_connection("vacancies.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT v.id, v.title, v.link, v.company, v.salary, 
-                       v.experience, v.work_format, v.region, v.published_at
-                FROM vacancies v
-                LEFT JOIN sent_notifications s ON v.id = s.vacancy_id
-                WHERE s.vacancy_id IS NULL
-                AND v.work_format LIKE '%Удаленная%'
-                LIMIT ?
-            """, (limit,))
-            return cursor.fetchall()
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row  # Доступ по имени колонки, как у словаря
+        cursor.execute("""
+            SELECT v.id, v.title, v.link, v.company, v.salary, 
+                   v.experience, v.work_format, v.region, v.published_at
+            FROM vacancies v
+            WHERE v.work_format LIKE '%Удаленная%'
+            AND NOT EXISTS (
+                SELECT 1 FROM sent_notifications s
+                WHERE s.user_id = ? AND s.vacancy_id = v.id
+            )
+            ORDER BY v.created_at DESC
+            LIMIT ?
+        """, (user_id, limit))
+        return cursor.fetchall()
     except Exception as e:
-        logging.error(f"Ошибка получения вакансий: {e}")
+        logging.error(f"Ошибка получения вакансий для пользователя {user_id}: {e}")
         return []
 
 
-def get_active_users():
+def get_active_users(conn):
     """Получение списка активных пользователей"""
     try:
-        with get_db_connection("users.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM users")
-            return [row[0] for row in cursor.fetchall()]
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM users")
+        return [row[0] for row in cursor.fetchall()]
     except Exception as e:
         logging.error(f"Ошибка получения пользователей: {e}")
         return []
 
 
-def mark_as_sent(vacancy_id, user_id):
-    """Помечаем вакансию как отправленную"""
+def remove_users(conn, user_ids):
+    """Удаление пользователей, заблокировавших бота, одним пакетом"""
+    if not user_ids:
+        return
     try:
-        with get_db_connection("vacancies.db") as conn:
-            conn.execute(
-                "INSERT OR IGNORE INTO sent_notifications (vacancy_id, user_id) VALUES (?, ?)",
-                (vacancy_id, user_id)
+        with conn:  # Одна транзакция: commit или rollback при ошибке
+            conn.executemany("DELETE FROM users WHERE user_id = ?", [(user_id,) for user_id in user_ids])
+        logging.info(f"Удалено пользователей, заблокировавших бота: {len(user_ids)}")
+    except Exception as e:
+        logging.error(f"Ошибка удаления пользователей {user_ids}: {e}")
+
+
+def mark_as_sent(conn, sent):
+    """Помечаем вакансии как отправленные: sent - список пар (vacancy_id, user_id)"""
+    if not sent:
+        return
+    try:
+        with conn:  # Одна транзакция: commit или rollback при ошибке
+            conn.executemany(
+                _INSERT_SENT_SQL,
+                sent
             )
-            conn.commit()
     except Exception as e:
-        logging.error(f"Ошибка отметки вакансии {vacancy_id} для пользователя {user_id}: {e}")
+        logging.error(f"Ошибка отметки отправленных вакансий ({len(sent)} шт.): {e}")
+
+
+async def notify_user(session, limiter, user_id, vacancies, sent):
+    """Последовательная отправка вакансий одному пользователю.
+
+    Успешные отправки добавляются в sent парами (vacancy_id, user_id).
+    Возвращает True, если пользователь заблокировал бота.
+    """
+    for vacancy in vacancies:
+        try:
+            await limiter.wait()
+            if await send_telegram_message(session, user_id, format_vacancy_message(vacancy)):
+                sent.append((vacancy['id'], user_id))
+            await asyncio.sleep(PER_CHAT_DELAY)  # Telegram не любит частые сообщения в один чат
+        except BotBlockedError as e:
+            logging.warning(str(e))
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка обработки пользователя {user_id}: {e}")
+    return False
 
 
-def check_and_notify():
+async def check_and_notify():
     """Основная функция проверки и отправки уведомлений"""
+    users_conn = vacancies_conn = None
     try:
-        # Получаем новые вакансии
-        new_vacancies = get_new_vacancies()
-        if not new_vacancies:
-            logging.info("Нет новых вакансий для отправки")
-            return
+        # По одному соединению на базу на весь цикл проверки
+        users_conn = get_db_connection("users.db")
+        vacancies_conn = get_db_connection("vacancies.db")
 
         # Получаем активных пользователей
-        users = get_active_users()
+        users = get_active_users(users_conn)
         if not users:
             logging.info("Нет активных пользователей для отправки")
             return
 
-        # Отправляем уведомления
-        for vacancy_row in new_vacancies:
-            vacancy = {
-                'id': vacancy_row[0],
-                'title': vacancy_row[1],
-                'link': vacancy_row[2],
-                'company': vacancy_row[3],
-                'salary': vacancy_row[4],
-                'experience': vacancy_row[5],
-                'work_format': vacancy_row[6],
-                'region': vacancy_row[7],
-                'published_at': vacancy_row[8]
-            }
-
-            message = format_vacancy_message(vacancy)
-
-            for user_id in users:
-                try:
-                    if send_telegram_message(user_id, message):
-                        mark_as_sent(vacancy['id'], user_id)
-                    time.sleep(0.5)  # Задержка между сообщениями
-                except Exception as e:
-                    logging.error(f"Ошибка обработки пользователя {user_id}: {e}")
+        # Новые вакансии у каждого пользователя свои. Проверка NOT EXISTS
+        # выполняется поиском по индексу UNIQUE(vacancy_id, user_id)
+        pending = {}
+        for user_id in users:
+            vacancies = get_new_vacancies(vacancies_conn, user_id)
+            if vacancies:
+                pending[user_id] = vacancies
+
+        if not pending:
+            logging.info("Нет новых вакансий для отправки")
+            return
+
+        # Пользователям рассылаем параллельно, общий темп ограничивает limiter.
+        # Одна сессия с keep-alive на всю рассылку
+        limiter = RateLimiter(TELEGRAM_RATE_LIMIT)
+        sent = []
+        async with aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=TELEGRAM_RATE_LIMIT),
+                timeout=aiohttp.ClientTimeout(total=10)
+        ) as session:
+            blocked = await asyncio.gather(*(
+                notify_user(session, limiter, user_id, vacancies, sent)
+                for user_id, vacancies in pending.items()
+            ))
+
+        # Отправленные отмечаем одной транзакцией
+        mark_as_sent(vacancies_conn, sent)
+
+        # Заблокировавших бота удаляем после рассылки, одним запросом
+        remove_users(users_conn, [user_id for user_id, is_blocked in zip(pending, blocked) if is_blocked])
 
     except Exception as e:
         logging.error(f"Критическая ошибка в check_and_notify: {e}")
+    finally:
+        for conn in (users_conn, vacancies_conn):
+            if conn:
+                conn.close()
 
 
-def main():
+async def main():
     """Точка входа в скрипт"""
     logging.info("Запуск нотификатора вакансий...")
     init_databases()
 
     while True:
-        check_and_notify()
-        time.sleep(300)  # Проверка каждые 5 минут
+        await check_and_notify()
+        await asyncio.sleep(CHECK_INTERVAL)
 
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Нотификатор остановлен")
     except Exception as e:
-        logging.critical(f"Фатальная ошибка: {e}")
\ No newline at end of file
+        logging.critical(f"Фатальная ошибка: {e}")
@@ -1,24 +1,30 @@
 import sqlite3
-import pandas as pd
+import xlsxwriter
 import asyncio
 from telegram import Bot
 from telegram.error import TelegramError
+from collections import Counter
 from datetime import datetime
 from config import TOKEN, CHAT_ID
 import os
 
+REPORT_BATCH_SIZE = 1000  # Строк, читаемых из БД за раз
+
 
 def generate_excel_report():
     """Генерация Excel-отчета с данными о вакансиях"""
+    conn = None
     try:
         if not os.path.exists("vacancies.db"):
             print("❌ Файл vacancies.db не найден")
             return None
 
-        conn = sqlite3.connect("vacancies.db")
+        # Только чтение: отчет не блокирует запись парсера в режиме WAL
+        conn = sqlite3.connect("file:vacancies.db?mode=ro", uri=True)
+        cursor = conn.cursor()
 
         # Получаем данные с опытом работы и форматом работы
-        df = pd.read_sql_query("""
+        cursor.execute("""
             SELECT 
                 title AS 'Должность',
                 company AS 'Компания',
@@ -30,11 +36,11 @@ def generate_excel_report():
                 link AS 'Ссылка'
             FROM vacancies
             ORDER BY published_at DESC
-        """, conn)
-
-        conn.close()
+        """)
+        columns = [description[0] for description in cursor.description]
 
-        if df.empty:
+        rows = cursor.fetchmany(REPORT_BATCH_SIZE)
+        if not rows:
             print("⚠ В базе нет данных о вакансиях")
             return None
 
@@ -42,68 +48,75 @@ def generate_excel_report():
         report_date = datetime.now().strftime("%Y-%m-%d_%H-%M")
         excel_filename = f"vacancies_report_{report_date}.xlsx"
 
-        # Сохраняем в Excel с форматированием
-        with pd.ExcelWriter(excel_filename, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Вакансии')
-
-            workbook = writer.book
-            worksheet = writer.sheets['Вакансии']
-
-            # Настраиваем стили
-            header_format = workbook.add_format({
-                'bold': True,
-                'align': 'center',
-                'valign': 'vcenter',
-                'border': 1
-            })
-
-            # Авто-ширина колонок
-            for col_num, column_title in enumerate(df.columns):
-                max_len = max(
-                    df[column_title].astype(str).map(len).max(),
-                    len(column_title)
-                ) + 2
-                worksheet.set_column(col_num, col_num, max_len)
-
-            # Форматируем заголовки
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
+        # constant_memory: строки сбрасываются на диск по мере записи,
+        # в памяти не держится ни вся выборка, ни весь лист
+        workbook = xlsxwriter.Workbook(excel_filename, {'constant_memory': True, 'use_zip64': True})
+        worksheet = workbook.add_worksheet('Вакансии')
+
+        # Настраиваем стили
+        header_format = workbook.add_format({
+            'bold': True,
+            'align': 'center',
+            'valign': 'vcenter',
+            'border': 1
+        })
+
+        # Форматируем заголовки
+        worksheet.write_row(0, 0, columns, header_format)
+
+        # Пишем строки пачками, попутно считая ширину колонок
+        max_lengths = [len(column) for column in columns]
+        row_num = 1
+        while rows:
+            for row in rows:
+                worksheet.write_row(row_num, 0, row)
+                for col_num, value in enumerate(row):
+                    if value is not None:  # NULL пишется пустой ячейкой
+                        max_lengths[col_num] = max(max_lengths[col_num], len(str(value)))
+                row_num += 1
+            rows = cursor.fetchmany(REPORT_BATCH_SIZE)
+
+        # Авто-ширина колонок
+        for col_num, max_len in enumerate(max_lengths):
+            worksheet.set_column(col_num, col_num, max_len + 2)
+
+        workbook.close()
 
         return excel_filename
 
     except Exception as e:
         print(f"❌ Ошибка при генерации отчета: {e}")
         return None
+    finally:
+        if conn:
+            conn.close()
 
 
-async def send_report_to_telegram(filename):
+async def send_report_to_telegram(bot, filename):
     """Отправка отчета в Telegram"""
     try:
-        bot = Bot(token=TOKEN)
-
         # Получаем статистику для сообщения
-        conn = sqlite3.connect("vacancies.db")
+        conn = sqlite3.connect("file:vacancies.db?mode=ro", uri=True)
         cursor = conn.cursor()
 
-        cursor.execute("SELECT COUNT(*) FROM vacancies")
-        total_vacancies = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(DISTINCT company) FROM vacancies")
-        unique_companies = cursor.fetchone()[0]
+        # Два прохода по таблице вместо четырех: скаляры одним запросом,
+        # оба распределения - из одной группировки по паре (опыт, формат)
+        cursor.execute("SELECT COUNT(*), COUNT(DISTINCT company) FROM vacancies")
+        total_vacancies, unique_companies = cursor.fetchone()
 
         cursor.execute("""
-            SELECT experience, COUNT(*) 
+            SELECT experience, work_format, COUNT(*) 
             FROM vacancies 
-            GROUP BY experience
+            GROUP BY experience, work_format
         """)
-        experience_stats = cursor.fetchall()
+        experience_counts = Counter()
+        work_format_counts = Counter()
+        for experience, work_format, count in cursor.fetchall():
+            experience_counts[experience] += count
+            work_format_counts[work_format] += count
 
-        cursor.execute("""
-            SELECT work_format, COUNT(*) 
-            FROM vacancies 
-            GROUP BY work_format
-        """)
-        work_format_stats = cursor.fetchall()
+        experience_stats = sorted(experience_counts.items(), key=lambda item: str(item[0]))
+        work_format_stats = sorted(work_format_counts.items(), key=lambda item: str(item[0]))
 
         conn.close()
 
@@ -146,7 +159,14 @@ async def main():
     excel_file = generate_excel_report()
 
     if excel_file:
-        if await send_report_to_telegram(excel_file):
+        # Бот живет ровно одну отправку: HTTP-клиент закрывается при выходе из блока
+        try:
+            async with Bot(token=TOKEN) as bot:
+                sent = await send_report_to_telegram(bot, excel_file)
+        except TelegramError as e:
+            print(f"❌ Ошибка подключения к Telegram: {e}")
+            sent = False
+        if sent:
             try:
                 os.remove(excel_file)
                 print(f"🗑 Временный файл {excel_file} удален")